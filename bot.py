@@ -1,5 +1,8 @@
-from strategy import get_signal
-from datetime import datetime, time as dt_time
+from strategy import get_signal, get_cache_state, restore_cache_state
+from datetime import datetime
+import sessions
+import execution
+import checkpoint
 import numpy as np
 import os
 import time
@@ -28,6 +31,7 @@ SYMBOL = "EURUSD"
 LOT = 0.10
 TIMEFRAME = mt5.TIMEFRAME_M30
 POSITION_TYPE = None
+last_ping_time = 0.0
 
 # Настройки управления рисками
 RISK_PERCENT = 1.0          # Процент риска от депозита
@@ -35,10 +39,9 @@ USE_TRAILING_STOP = True    # Использовать трейлинг стоп
 USE_PARTIAL_CLOSE = True    # Использовать частичное закрытие
 PARTIAL_CLOSE_PIPS = 30     # При скольких пипсах закрывать частично
 
-# Торговые часы (GMT)
-TRADING_START = dt_time(6, 0)   # 06:00
-TRADING_END = dt_time(22, 0)    # 22:00
+# Торговые часы задаются в sessions.py
 PING_INTERVAL = 10800  # 3 часа в секундах
+POSITION_CHECK_INTERVAL = 30  # Контроль открытой позиции (трейлинг, частичное закрытие)
 
 
 def send_telegram_message(message):
@@ -72,22 +75,83 @@ def initialize_mt5():
 
 
 def is_trading_time():
-    """Проверка торгового времени и выходных"""
-    now = datetime.now()
-    current_time = now.time()
-    weekday = now.weekday()
-    
-    # Проверка выходных (суббота=5, воскресенье=6)
-    if weekday >= 5:
-        return False
-        
-    # Проверка торговых часов
-    return TRADING_START <= current_time < TRADING_END
+    """Проверка торгового времени, выходных и праздников по календарю сессий"""
+    tick = mt5.symbol_info_tick(SYMBOL)
+    if tick:
+        sessions.update_server_time(SYMBOL, tick.time_msc)
+    return sessions.is_trading_time(SYMBOL)
+
+
+def wait_for_next_event():
+    """Сон без опроса до ближайшего события: свеча, сессия, пинг или контроль позиции"""
+    position_check = POSITION_CHECK_INTERVAL if POSITION_TYPE is not None else None
+    wake_at, reason = sessions.next_wakeup(SYMBOL, last_ping_time + PING_INTERVAL, position_check)
+    logging.info(f"💤 Ожидание до {sessions.format_time(wake_at)} ({reason})")
+    sessions.sleep_until(wake_at)
+
+
+def set_position_type(position_type):
+    """Смена текущей позиции с записью в журнал состояния"""
+    global POSITION_TYPE
+
+    POSITION_TYPE = position_type
+    checkpoint.record('position_type', position_type)
+
+    # Позиций больше нет — отметки о частичном закрытии не нужны
+    if position_type is None:
+        checkpoint.record('partial_closed', set())
+
+
+def restore_state():
+    """
+    Восстановление состояния после перезапуска и сверка с MT5
+
+    Позиции запрашиваются одним вызовом: сохраненные отметки о частичном
+    закрытии оставляются только для еще открытых позиций. Если MT5 не
+    ответил, сохраненное состояние остается как есть.
+    """
+    global last_ping_time, POSITION_TYPE
+
+    state = checkpoint.resume()
+    last_ping_time = state.get('last_ping_time', sessions.current_time())
+    restore_cache_state(state.get('strategy_cache'))
+    sessions.restore_server_delta(state.get('server_delta'))
+
+    positions = mt5.positions_get(symbol=SYMBOL)
+    if positions is None:
+        POSITION_TYPE = state.get('position_type')
+        logging.warning(f"⚠️ Не удалось получить позиции для сверки: {mt5.last_error()}. "
+                        f"Используется сохраненное состояние: {POSITION_TYPE}")
+        return
+
+    open_tickets = {pos.ticket for pos in positions}
+    checkpoint.record('partial_closed', set(state.get('partial_closed', ())) & open_tickets)
+
+    saved_position = state.get('position_type')
+    if not positions:
+        set_position_type(None)
+    else:
+        set_position_type("buy" if positions[0].type == mt5.POSITION_TYPE_BUY else "sell")
+    if saved_position != POSITION_TYPE:
+        logging.warning(f"⚠️ Позиция после перезапуска: сохранена {saved_position}, в MT5 {POSITION_TYPE}")
+
+
+def save_state(force=False):
+    """Обновление кэшей в снимке и периодическое (или немедленное) сохранение состояния"""
+    checkpoint.stage('strategy_cache', get_cache_state())
+    checkpoint.stage('server_delta', sessions.server_delta())
+    if force:
+        checkpoint.checkpoint()
+    else:
+        checkpoint.maybe_checkpoint()
 
 
 def get_current_position():
-    """Получение текущей позиции"""
+    """Получение текущей позиции (при ошибке MT5 — последняя известная)"""
     positions = mt5.positions_get(symbol=SYMBOL)
+    if positions is None:
+        logging.warning(f"⚠️ Не удалось получить позиции: {mt5.last_error()}")
+        return POSITION_TYPE
     if not positions:
         return None
     return "buy" if positions[0].type == mt5.POSITION_TYPE_BUY else "sell"
@@ -96,6 +160,9 @@ def get_current_position():
 def close_open_positions():
     """Закрытие всех открытых позиций"""
     positions = mt5.positions_get(symbol=SYMBOL)
+    if positions is None:
+        logging.error(f"Не удалось получить позиции для закрытия: {mt5.last_error()}")
+        return False
     if not positions:
         return True
 
@@ -123,7 +190,7 @@ def close_open_positions():
             "type_filling": mt5.ORDER_FILLING_IOC,
         }
 
-        result = mt5.order_send(request)
+        result = execution.send_order(request)
         if result.retcode == mt5.TRADE_RETCODE_DONE:
             send_telegram_message("✅ Позиция закрыта")
             logging.info(f"Позиция закрыта: {pos.ticket}")
@@ -188,14 +255,15 @@ def calculate_dynamic_sl_tp(signal, entry_price, atr_value):
 def get_current_atr():
     """Получение текущего значения ATR"""
     try:
-        from strategy import get_market_data, calculate_indicators
-        
+        from strategy import get_market_data, get_indicators
+
         market_data = get_market_data()
         if market_data is None:
             return 0.0020  # значение по умолчанию
-        
-        indicators = calculate_indicators(market_data)
-        if indicators is None or np.isnan(indicators['atr'][-1]):
+
+        # Считается только ATR, остальные индикаторы не нужны
+        indicators = get_indicators(market_data)
+        if np.isnan(indicators['atr'][-1]):
             return 0.0020  # значение по умолчанию
         
         return indicators['atr'][-1]
@@ -247,7 +315,7 @@ def open_trade(signal, risk_percent=1.0):
         "type_filling": mt5.ORDER_FILLING_IOC,
     }
 
-    result = mt5.order_send(request)
+    result = execution.send_order(request)
     if result.retcode != mt5.TRADE_RETCODE_DONE:
         error_msg = f"❌ Ошибка при открытии позиции: {result.retcode} - {result.comment}"
         send_telegram_message(error_msg)
@@ -309,7 +377,7 @@ def update_trailing_stop():
                     "tp": pos.tp,  # Оставляем TP без изменений
                 }
                 
-                result = mt5.order_send(request)
+                result = execution.send_order(request)
                 if result.retcode == mt5.TRADE_RETCODE_DONE:
                     move_pips = abs(new_sl - current_sl) / pip_value
                     direction = "BUY" if pos.type == mt5.POSITION_TYPE_BUY else "SELL"
@@ -345,7 +413,8 @@ def check_partial_close():
                 profit_pips = (pos.price_open - current_price) / pip_value
             
             # Если прибыль больше 30 пипсов и позиция не была частично закрыта
-            if profit_pips > 30 and pos.volume >= LOT:
+            partial_closed = checkpoint.get('partial_closed', set())
+            if profit_pips > 30 and pos.ticket not in partial_closed and pos.volume >= LOT:
                 partial_volume = round(pos.volume * 0.5, 2)  # Закрываем 50%
                 
                 order_type = mt5.ORDER_TYPE_SELL if pos.type == mt5.POSITION_TYPE_BUY else mt5.ORDER_TYPE_BUY
@@ -365,8 +434,9 @@ def check_partial_close():
                     "type_filling": mt5.ORDER_FILLING_IOC,
                 }
                 
-                result = mt5.order_send(request)
+                result = execution.send_order(request)
                 if result.retcode == mt5.TRADE_RETCODE_DONE:
+                    checkpoint.record('partial_closed', partial_closed | {pos.ticket})
                     direction = "BUY" if pos.type == mt5.POSITION_TYPE_BUY else "SELL"
                     msg = f"💰 Частичное закрытие ({direction}): 50% позиции при +{profit_pips:.1f} пипсах"
                     send_telegram_message(msg)
@@ -387,37 +457,35 @@ def get_strategy_signal():
 
 def run():
     """Основной цикл бота"""
-    global POSITION_TYPE
+    global last_ping_time
     
     try:
         initialize_mt5()
-        last_ping_time = time.time()
+        restore_state()
 
         while True:
             try:
                 # Обновление состояния позиции
-                POSITION_TYPE = get_current_position()
+                set_position_type(get_current_position())
                 
                 # Пинг каждые 3 часа
-                if time.time() - last_ping_time >= PING_INTERVAL:
+                if sessions.current_time() - last_ping_time >= PING_INTERVAL:
                     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    send_telegram_message(f"✅ Бот активен. Время: {now}")
+                    send_telegram_message(f"✅ Бот активен. Время: {now}\n📉 {execution.format_report(SYMBOL)}")
                     logging.info("Ping отправлен")
-                    last_ping_time = time.time()
+                    last_ping_time = sessions.current_time()
+                    checkpoint.record('last_ping_time', last_ping_time)
 
                 # Проверка торгового времени
                 if not is_trading_time():
-                    current_hour = datetime.now().hour
-                    weekday = datetime.now().weekday()
-                    
-                    if weekday >= 5:
-                        logging.info("🌙 Выходные дни. Торговля приостановлена.")
-                    else:
-                        logging.info(f"🌙 Вне торгового времени ({current_hour}:xx). Ожидание...")
-                    
-                    time.sleep(300)  # 5 минут
+                    logging.info("🌙 Вне торгового времени. Торговля приостановлена.")
+                    save_state()
+                    wait_for_next_event()
                     continue
 
+                # Статистика спреда и частоты тиков
+                execution.update_tick_stats(SYMBOL)
+
                 # Управление существующими позициями
                 if POSITION_TYPE is not None:
                     update_trailing_stop()  # Обновляем трейлинг стоп
@@ -433,22 +501,30 @@ def run():
                 if signal and signal != POSITION_TYPE:
                     logging.info("📈 Новый сигнал! Выполняется смена позиции...")
                     
-                    # Закрытие текущих позиций
+                    # Закрытие текущих позиций (выход не зависит от спреда)
                     if POSITION_TYPE is not None:
                         if not close_open_positions():
                             logging.warning("⚠️ Не удалось закрыть все позиции")
                             time.sleep(30)
                             continue
+                        set_position_type(None)
                     
                     # Небольшая пауза после закрытия
                     time.sleep(2)
                     
-                    # Открытие новой позиции
-                    if open_trade(signal):
-                        POSITION_TYPE = signal
-                        logging.info(f"✅ Новая позиция открыта: {POSITION_TYPE}")
+                    # Вход только при нормальном спреде
+                    entry_ok, spread_msg = execution.wait_for_entry(SYMBOL)
+                    if not entry_ok:
+                        logging.warning(f"⚠️ Вход пропущен: {spread_msg}")
                     else:
-                        logging.warning("⚠️ Не удалось открыть новую позицию")
+                        logging.info(spread_msg)
+
+                        # Открытие новой позиции
+                        if open_trade(signal):
+                            set_position_type(signal)
+                            logging.info(f"✅ Новая позиция открыта: {POSITION_TYPE}")
+                        else:
+                            logging.warning("⚠️ Не удалось открыть новую позицию")
                 
                 elif signal == POSITION_TYPE and POSITION_TYPE is not None:
                     logging.info("➡️ Сигнал подтверждает текущую позицию")
@@ -456,8 +532,9 @@ def run():
                 elif not signal:
                     logging.info("⚪ Нет торгового сигнала")
                 
-                # Пауза между проверками
-                time.sleep(30)  # 30 секунд
+                # Сохранение состояния и пауза до следующего события
+                save_state()
+                wait_for_next_event()
 
             except Exception as e:
                 error_msg = f"❌ Ошибка в цикле: {e}"
@@ -476,6 +553,11 @@ def run():
         run()
     
     finally:
+        try:
+            save_state(force=True)
+        except Exception as e:
+            logging.error(f"Ошибка сохранения состояния: {e}")
+
         if mt5.initialize():
             mt5.shutdown()
             logging.info("🔌 MT5 отключен")
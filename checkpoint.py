@@ -0,0 +1,191 @@
+import os
+import time
+import zlib
+import pickle
+import struct
+import logging
+
+# Настройки сохранения состояния
+STATE_DIR = "state"
+SNAPSHOT_FILE = "snapshot.bin"
+WAL_FILE = "state.wal"
+CHECKPOINT_INTERVAL = 300   # Снимок состояния не реже чем раз в 5 минут
+WAL_MAX_RECORDS = 1000      # ...или когда журнал вырос до этого числа записей
+
+# Формат снимка: заголовок (сигнатура, версия, номер последней записи, CRC32) + сжатый pickle
+SNAPSHOT_MAGIC = b"MBCK"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("<4sHQI")
+# Формат записи журнала: длина, CRC32, номер записи + pickle пары (ключ, значение)
+WAL_HEADER = struct.Struct("<IIQ")
+
+_state = {}
+_seq = 0
+_wal = None
+_wal_records = 0
+_last_checkpoint = 0.0
+
+
+def _path(name):
+    return os.path.join(STATE_DIR, name)
+
+
+def _fsync_dir():
+    # На Windows каталог нельзя открыть для fsync
+    if os.name == "nt":
+        return
+    fd = os.open(STATE_DIR, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _read_snapshot():
+    """Чтение снимка: (состояние, номер последней записи) или пустое состояние"""
+    try:
+        with open(_path(SNAPSHOT_FILE), "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return {}, 0
+
+    try:
+        magic, version, seq, crc = SNAPSHOT_HEADER.unpack_from(raw)
+        payload = raw[SNAPSHOT_HEADER.size:]
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or zlib.crc32(payload) != crc:
+            raise ValueError("неверный заголовок или контрольная сумма")
+        return pickle.loads(zlib.decompress(payload)), seq
+    except Exception as e:
+        logging.error(f"Снимок состояния поврежден, используется только журнал: {e}")
+        return {}, 0
+
+
+def _replay_wal(state, after_seq):
+    """Применение записей журнала после снимка; поврежденный хвост обрезается"""
+    try:
+        with open(_path(WAL_FILE), "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return after_seq, 0
+
+    seq = after_seq
+    applied = 0
+    pos = 0
+    while pos + WAL_HEADER.size <= len(raw):
+        length, crc, record_seq = WAL_HEADER.unpack_from(raw, pos)
+        payload = raw[pos + WAL_HEADER.size:pos + WAL_HEADER.size + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        pos += WAL_HEADER.size + length
+
+        # Записи, уже вошедшие в снимок, пропускаются
+        if record_seq <= seq:
+            continue
+        key, value = pickle.loads(payload)
+        state[key] = value
+        seq = record_seq
+        applied += 1
+
+    # Недописанная при сбое запись отрезается, чтобы новые записи шли за целыми
+    if pos < len(raw):
+        logging.warning(f"Журнал состояния поврежден после записи {seq}, хвост отброшен")
+        with open(_path(WAL_FILE), "r+b") as f:
+            f.truncate(pos)
+            os.fsync(f.fileno())
+
+    return seq, applied
+
+
+def resume():
+    """
+    Восстановление состояния после перезапуска
+
+    Загружает последний снимок и применяет журнал переходов поверх него.
+    Returns:
+        Словарь состояния (пустой при первом запуске)
+    """
+    global _state, _seq, _wal, _wal_records, _last_checkpoint
+
+    started = time.perf_counter()
+    if _wal is not None:
+        _wal.close()
+        _wal = None
+    os.makedirs(STATE_DIR, exist_ok=True)
+
+    state, snapshot_seq = _read_snapshot()
+    _seq, applied = _replay_wal(state, snapshot_seq)
+    _state = state
+    _wal_records = applied
+    _last_checkpoint = time.time()
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logging.info(f"💾 Состояние восстановлено за {elapsed_ms:.1f} мс: "
+                 f"снимок #{snapshot_seq}, записей журнала: {applied}")
+    return dict(_state)
+
+
+def get(key, default=None):
+    """Значение из сохраненного состояния"""
+    return _state.get(key, default)
+
+
+def record(key, value):
+    """Запись перехода состояния в журнал (сразу на диск)"""
+    global _wal, _seq, _wal_records
+
+    if key in _state and _state[key] == value:
+        return
+
+    _seq += 1
+    _state[key] = value
+    payload = pickle.dumps((key, value), protocol=pickle.HIGHEST_PROTOCOL)
+
+    if _wal is None:
+        os.makedirs(STATE_DIR, exist_ok=True)
+        _wal = open(_path(WAL_FILE), "ab")
+    _wal.write(WAL_HEADER.pack(len(payload), zlib.crc32(payload), _seq) + payload)
+    _wal.flush()
+    os.fsync(_wal.fileno())
+    _wal_records += 1
+
+
+def stage(key, value):
+    """Значение, которое сохраняется только в снимке (кэши, которые не жалко потерять)"""
+    _state[key] = value
+
+
+def checkpoint():
+    """Атомарная запись снимка состояния и очистка журнала"""
+    global _wal, _wal_records, _last_checkpoint
+
+    os.makedirs(STATE_DIR, exist_ok=True)
+    payload = zlib.compress(pickle.dumps(_state, protocol=pickle.HIGHEST_PROTOCOL))
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, _seq, zlib.crc32(payload))
+
+    # Запись во временный файл и атомарная замена: снимок всегда целый
+    tmp_path = _path(SNAPSHOT_FILE + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(header + payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, _path(SNAPSHOT_FILE))
+    _fsync_dir()
+
+    # Журнал обнуляется только после замены снимка; при сбое между этими шагами
+    # его записи имеют номера не больше номера снимка и будут пропущены
+    if _wal is not None:
+        _wal.close()
+        _wal = None
+    open(_path(WAL_FILE), "wb").close()
+
+    _wal_records = 0
+    _last_checkpoint = time.time()
+
+
+def maybe_checkpoint():
+    """Снимок состояния, если пора по времени или размеру журнала"""
+    if _wal_records >= WAL_MAX_RECORDS or time.time() - _last_checkpoint >= CHECKPOINT_INTERVAL:
+        try:
+            checkpoint()
+        except Exception as e:
+            logging.error(f"Ошибка сохранения снимка состояния: {e}")
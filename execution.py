@@ -0,0 +1,237 @@
+import numpy as np
+import MetaTrader5 as mt5
+import logging
+import time
+
+# Настройки анализа исполнения
+PIP_VALUE = 0.0001            # 1 пип для EURUSD
+SPREAD_WINDOW = 5000          # Сколько последних спредов хранить по символу
+SPREAD_PERCENTILE = 90        # Вход только при спреде не выше этого перцентиля
+MIN_SPREAD_SAMPLES = 200      # Пока данных меньше, фильтр спреда не применяется
+EXECUTION_WINDOW = 500        # Сколько последних исполнений хранить по символу
+TICK_RATE_ALPHA = 0.2         # Сглаживание частоты тиков (EMA)
+INITIAL_LOOKBACK = 3600       # История тиков при первом обновлении (секунды)
+MAX_TICKS_PER_UPDATE = 20000  # Тиков за один запрос к MT5 (история читается постранично)
+ENTRY_RETRY_DELAY = 5         # Пауза между проверками спреда перед входом
+ENTRY_MAX_WAIT = 60           # Сколько ждать нормального спреда, прежде чем пропустить вход
+
+_tick_stats = {}
+_execution_stats = {}
+
+
+class RollingWindow:
+    """Кольцевой буфер фиксированного размера для скользящей статистики"""
+
+    def __init__(self, size):
+        self._values = np.empty(size)
+        self._size = size
+        self._pos = 0
+        self._count = 0
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=float)[-self._size:]
+        n = len(values)
+        first = min(n, self._size - self._pos)
+        self._values[self._pos:self._pos + first] = values[:first]
+        self._values[:n - first] = values[first:]
+        self._pos = (self._pos + n) % self._size
+        self._count = min(self._count + n, self._size)
+
+    def values(self):
+        return self._values[:self._count]
+
+    def percentile(self, q):
+        return float(np.percentile(self.values(), q)) if self._count else None
+
+    def __len__(self):
+        return self._count
+
+
+def _get_tick_stats(symbol):
+    if symbol not in _tick_stats:
+        _tick_stats[symbol] = {
+            'spreads': RollingWindow(SPREAD_WINDOW),
+            'last_spread': None,
+            'last_tick_msc': 0,
+            'tick_rate': None,
+        }
+    return _tick_stats[symbol]
+
+
+def _get_execution_stats(symbol, action):
+    # Отдельная статистика для каждого типа запроса: сделки не смешиваются с изменением SL/TP
+    key = (symbol, action)
+    if key not in _execution_stats:
+        _execution_stats[key] = {
+            'slippage': RollingWindow(EXECUTION_WINDOW),
+            'latency': RollingWindow(EXECUTION_WINDOW),
+            'orders': 0,
+            'rejected': 0,
+        }
+    return _execution_stats[key]
+
+
+def update_tick_stats(symbol):
+    """Обновление статистики спреда и частоты тиков по новым тикам из MT5"""
+    stats = _get_tick_stats(symbol)
+    previous_msc = stats['last_tick_msc']
+
+    if previous_msc:
+        date_from = previous_msc // 1000
+    else:
+        tick = mt5.symbol_info_tick(symbol)
+        if tick is None:
+            return stats
+        date_from = tick.time - INITIAL_LOOKBACK
+
+    # copy_ticks_from отдает самые старые тики после date_from, поэтому
+    # читаем страницами, пока не дойдем до последнего тика
+    new_ticks = 0
+    while True:
+        ticks = mt5.copy_ticks_from(symbol, date_from, MAX_TICKS_PER_UPDATE, mt5.COPY_TICKS_INFO)
+        if ticks is None or len(ticks) == 0:
+            break
+        page_full = len(ticks) >= MAX_TICKS_PER_UPDATE
+
+        ticks = ticks[(ticks['time_msc'] > stats['last_tick_msc']) & (ticks['bid'] > 0) & (ticks['ask'] > 0)]
+        if len(ticks) == 0:
+            break
+
+        spreads = (ticks['ask'] - ticks['bid']) / PIP_VALUE
+        stats['spreads'].extend(spreads)
+        stats['last_spread'] = float(spreads[-1])
+        stats['last_tick_msc'] = int(ticks['time_msc'][-1])
+        new_ticks += len(ticks)
+
+        if not page_full:
+            break
+        date_from = stats['last_tick_msc'] // 1000
+
+    # Частота тиков считается только между обновлениями, не по начальной истории
+    if previous_msc and new_ticks:
+        elapsed = (stats['last_tick_msc'] - previous_msc) / 1000
+        if elapsed > 0:
+            rate = new_ticks / elapsed
+            previous = stats['tick_rate']
+            stats['tick_rate'] = rate if previous is None else previous + TICK_RATE_ALPHA * (rate - previous)
+
+    return stats
+
+
+def spread_report(symbol):
+    """Текущая статистика спреда символа (в пипсах) и частоты тиков"""
+    stats = _get_tick_stats(symbol)
+    spreads = stats['spreads']
+    return {
+        'current': stats['last_spread'],
+        'median': spreads.percentile(50),
+        'threshold': spreads.percentile(SPREAD_PERCENTILE),
+        'samples': len(spreads),
+        'tick_rate': stats['tick_rate'],
+    }
+
+
+def entry_allowed(symbol):
+    """
+    Фильтр входа по спреду
+
+    Вход разрешен, если текущий спред (по последнему тику) не выше
+    SPREAD_PERCENTILE последних спредов символа.
+    """
+    update_tick_stats(symbol)
+    report = spread_report(symbol)
+
+    tick = mt5.symbol_info_tick(symbol)
+    if tick is None or tick.bid <= 0 or tick.ask <= 0:
+        return False, "Нет данных о спреде"
+    current = (tick.ask - tick.bid) / PIP_VALUE
+
+    if report['samples'] < MIN_SPREAD_SAMPLES:
+        return True, f"Спред {current:.1f}п (мало данных для фильтра)"
+    if current > report['threshold']:
+        return False, (f"Широкий спред {current:.1f}п "
+                       f"(p{SPREAD_PERCENTILE}: {report['threshold']:.1f}п)")
+    return True, f"Спред {current:.1f}п (p{SPREAD_PERCENTILE}: {report['threshold']:.1f}п)"
+
+
+def wait_for_entry(symbol, max_wait=ENTRY_MAX_WAIT):
+    """Ожидание нормального спреда перед входом; (False, причина) если так и не дождались"""
+    deadline = time.time() + max_wait
+    while True:
+        allowed, msg = entry_allowed(symbol)
+        if allowed or time.time() + ENTRY_RETRY_DELAY > deadline:
+            return allowed, msg
+        logging.info(f"⏳ Вход отложен: {msg}")
+        time.sleep(ENTRY_RETRY_DELAY)
+
+
+def send_order(request):
+    """Отправка ордера в MT5 с учетом задержки и проскальзывания"""
+    started = time.perf_counter()
+    result = mt5.order_send(request)
+    latency_ms = (time.perf_counter() - started) * 1000
+    record_execution(request, result, latency_ms)
+    return result
+
+
+def record_execution(request, result, latency_ms):
+    """Учет результата ордера: запрошенная и фактическая цена, задержка"""
+    symbol = request.get("symbol")
+    action = request.get("action")
+    stats = _get_execution_stats(symbol, action)
+    stats['orders'] += 1
+    stats['latency'].extend([latency_ms])
+
+    if result is None or result.retcode != mt5.TRADE_RETCODE_DONE:
+        stats['rejected'] += 1
+        return
+
+    # Проскальзывание только для сделок по рынку с известной ценой
+    requested = request.get("price")
+    if action != mt5.TRADE_ACTION_DEAL or not requested or not result.price:
+        return
+
+    # Положительное проскальзывание — исполнение хуже запрошенной цены
+    direction = 1 if request.get("type") == mt5.ORDER_TYPE_BUY else -1
+    slippage = direction * (result.price - requested) / PIP_VALUE
+    stats['slippage'].extend([slippage])
+    logging.info(
+        f"Исполнение {symbol}: запрошено {requested:.5f}, исполнено {result.price:.5f}, "
+        f"проскальзывание {slippage:+.1f}п, задержка {latency_ms:.0f} мс"
+    )
+
+
+def execution_report(symbol, action=mt5.TRADE_ACTION_DEAL):
+    """Сводка качества исполнения по последним запросам символа данного типа (по умолчанию сделки)"""
+    stats = _get_execution_stats(symbol, action)
+    slippage = stats['slippage'].values()
+    latency = stats['latency'].values()
+    return {
+        'orders': stats['orders'],
+        'rejected': stats['rejected'],
+        'slippage_mean': float(np.mean(slippage)) if len(slippage) else None,
+        'slippage_p95': stats['slippage'].percentile(95),
+        'latency_mean': float(np.mean(latency)) if len(latency) else None,
+        'latency_p95': stats['latency'].percentile(95),
+    }
+
+
+def format_report(symbol):
+    """Краткий отчет по спреду и исполнению для уведомлений"""
+    spread = spread_report(symbol)
+    execution = execution_report(symbol)
+    modifications = execution_report(symbol, mt5.TRADE_ACTION_SLTP)
+
+    parts = []
+    if spread['median'] is not None:
+        parts.append(f"спред p50/p{SPREAD_PERCENTILE}: {spread['median']:.1f}/{spread['threshold']:.1f}п")
+    if spread['tick_rate'] is not None:
+        parts.append(f"тиков/с: {spread['tick_rate']:.2f}")
+    parts.append(f"сделок: {execution['orders']} (отклонено {execution['rejected']})")
+    if execution['slippage_mean'] is not None:
+        parts.append(f"проскальзывание ср/p95: {execution['slippage_mean']:+.2f}/{execution['slippage_p95']:+.2f}п")
+    if execution['latency_mean'] is not None:
+        parts.append(f"задержка ср/p95: {execution['latency_mean']:.0f}/{execution['latency_p95']:.0f} мс")
+    if modifications['orders']:
+        parts.append(f"изменений SL/TP: {modifications['orders']} (отклонено {modifications['rejected']})")
+    return ", ".join(parts)
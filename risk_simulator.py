@@ -0,0 +1,279 @@
+import talib
+import numpy as np
+import MetaTrader5 as mt5
+import logging
+
+# Настройки симуляции
+SYMBOL = "EURUSD"
+TIMEFRAME = mt5.TIMEFRAME_M30
+HISTORY_BARS = 20000        # Сколько свечей истории брать для бутстрэпа
+PIP_VALUE = 0.0001          # 1 пип для EURUSD
+MAX_HOLD_BARS = 96          # Максимальное удержание сделки (96 × M30 = 2 суток)
+RUIN_LEVEL = 0.5            # Разорение = потеря 50% депозита
+MAX_CHUNK_CELLS = 4_000_000  # Ограничение памяти: элементов в одной пачке (пути × сделки × бары)
+
+# Политика по умолчанию — повторяет настройки bot.py
+DEFAULT_POLICY = {
+    'sl_atr_multiplier': 1.5,    # Стоп-лосс = 1.5 * ATR
+    'tp_atr_multiplier': 2.5,    # Тейк-профит = 2.5 * ATR
+    'min_sl_pips': 15,
+    'max_sl_pips': 50,
+    'min_tp_pips': 20,
+    'max_tp_pips': 80,
+    'use_trailing_stop': True,
+    'trailing_atr_multiplier': 1.0,  # Трейлинг дистанция = 1 ATR
+    'min_trailing_pips': 10,
+    'use_partial_close': True,
+    'partial_close_pips': 30,
+    'partial_close_fraction': 0.5,
+    'risk_percent': 1.0,
+    'spread_pips': 1.0,
+}
+
+
+def make_policy(**overrides):
+    """Создание варианта политики на основе политики по умолчанию"""
+    unknown = set(overrides) - set(DEFAULT_POLICY)
+    if unknown:
+        raise ValueError(f"Неизвестные параметры политики: {', '.join(sorted(unknown))}")
+    policy = dict(DEFAULT_POLICY)
+    policy.update(overrides)
+    return policy
+
+
+def load_history(bars=HISTORY_BARS):
+    """Загрузка истории свечей из MT5 для бутстрэпа ценовых путей"""
+    rates = mt5.copy_rates_from_pos(SYMBOL, TIMEFRAME, 0, bars)
+    if rates is None or len(rates) == 0:
+        logging.error("Не удалось получить исторические данные для симуляции")
+        return None
+
+    return {
+        'open': np.asarray(rates['open'], dtype=float),
+        'high': np.asarray(rates['high'], dtype=float),
+        'low': np.asarray(rates['low'], dtype=float),
+        'close': np.asarray(rates['close'], dtype=float),
+    }
+
+
+def prepare_history(data, hold_bars=MAX_HOLD_BARS):
+    """
+    Подготовка истории: ATR на каждой свече и допустимые точки входа
+
+    Вход возможен на закрытии свечи, где ATR уже определён и после
+    которой есть ещё hold_bars свечей для сопровождения сделки.
+    """
+    high = np.asarray(data['high'], dtype=float)
+    low = np.asarray(data['low'], dtype=float)
+    close = np.asarray(data['close'], dtype=float)
+    atr = talib.ATR(high, low, close, timeperiod=14)
+
+    last_entry = len(close) - hold_bars - 1
+    entries = np.flatnonzero(~np.isnan(atr[:last_entry + 1]))
+    if len(entries) == 0:
+        raise ValueError(f"Недостаточно истории: {len(close)} свечей при удержании {hold_bars}")
+
+    return {'high': high, 'low': low, 'close': close, 'atr': atr, 'entries': entries}
+
+
+def simulate_trade_outcomes(history, policy, n_paths, n_trades, rng, hold_bars=MAX_HOLD_BARS):
+    """
+    Векторная симуляция сделок по политике SL/TP, трейлинга и частичного закрытия
+
+    Для каждой из n_paths × n_trades сделок случайно выбирается точка входа
+    в истории (бутстрэп ценовых путей) и направление. Сделка сопровождается
+    по свечам так же, как в bot.py. Возвращает матрицу результатов в R
+    (прибыль в долях начального риска) размером (n_paths, n_trades).
+    """
+    shape = (n_paths, n_trades)
+    start = history['entries'][rng.integers(0, len(history['entries']), size=shape)]
+    direction = np.where(rng.random(shape) < 0.5, 1.0, -1.0)  # 1 = buy, -1 = sell
+
+    entry = history['close'][start]
+    atr = history['atr'][start]
+
+    # Расстояния в пипсах с ограничениями, как в calculate_dynamic_sl_tp
+    sl_pips = np.clip(atr * policy['sl_atr_multiplier'] / PIP_VALUE,
+                      policy['min_sl_pips'], policy['max_sl_pips'])
+    tp_pips = np.clip(atr * policy['tp_atr_multiplier'] / PIP_VALUE,
+                      policy['min_tp_pips'], policy['max_tp_pips'])
+    trail_pips = np.maximum(atr * policy['trailing_atr_multiplier'] / PIP_VALUE,
+                            policy['min_trailing_pips'])
+
+    # Уровень стопа в пипсах прибыли относительно входа
+    stop = -sl_pips
+    remaining = np.ones(shape)
+    realized = np.zeros(shape)
+    is_open = np.ones(shape, dtype=bool)
+    partial_done = np.zeros(shape, dtype=bool)
+    partial_fraction = policy['partial_close_fraction']
+
+    for offset in range(1, hold_bars + 1):
+        idx = start + offset
+        high = history['high'][idx]
+        low = history['low'][idx]
+        close = history['close'][idx]
+
+        # Прибыль в пипсах в пользу позиции: лучшая, худшая и на закрытии свечи
+        best = np.where(direction > 0, high - entry, entry - low) / PIP_VALUE
+        worst = np.where(direction > 0, low - entry, entry - high) / PIP_VALUE
+        last = direction * (close - entry) / PIP_VALUE
+
+        # Стоп проверяется первым (консервативно при неизвестном порядке внутри свечи)
+        hit_sl = is_open & (worst <= stop)
+        realized += np.where(hit_sl, remaining * stop, 0.0)
+        is_open &= ~hit_sl
+
+        if policy['use_partial_close']:
+            # Если TP ближе уровня частичного закрытия, сервер закроет позицию по TP раньше
+            hit_partial = (is_open & ~partial_done & (best > policy['partial_close_pips'])
+                           & (policy['partial_close_pips'] < tp_pips))
+            closed = remaining * partial_fraction
+            realized += np.where(hit_partial, closed * policy['partial_close_pips'], 0.0)
+            remaining = np.where(hit_partial, remaining - closed, remaining)
+            partial_done |= hit_partial
+
+        hit_tp = is_open & (best >= tp_pips)
+        realized += np.where(hit_tp, remaining * tp_pips, 0.0)
+        is_open &= ~hit_tp
+
+        if policy['use_trailing_stop']:
+            # Подтягиваем стоп только в прибыльную сторону и ниже текущей цены
+            new_stop = last - trail_pips
+            stop = np.where(is_open & (new_stop > stop), new_stop, stop)
+
+        if not is_open.any():
+            break
+
+    # Незакрытые за время удержания сделки закрываются по последней цене
+    realized += np.where(is_open, remaining * last, 0.0)
+    realized -= policy['spread_pips']
+
+    return realized / sl_pips
+
+
+def bootstrap_outcomes(r_multiples, n_paths, n_trades, rng):
+    """Бутстрэп фактических результатов сделок (в R) в матрицу (n_paths, n_trades)"""
+    r_multiples = np.asarray(r_multiples, dtype=float)
+    if len(r_multiples) == 0:
+        raise ValueError("Нет результатов сделок для бутстрэпа")
+    return r_multiples[rng.integers(0, len(r_multiples), size=(n_paths, n_trades))]
+
+
+def equity_statistics(r_matrix, risk_percent, ruin_level=RUIN_LEVEL):
+    """
+    Кривые капитала для матрицы результатов в R
+
+    Каждая сделка рискует risk_percent от текущего капитала.
+    Возвращает (итоговый капитал, максимальная просадка, флаг разорения) по путям.
+    """
+    growth = np.maximum(1.0 + r_matrix * (risk_percent / 100.0), 0.0)
+    equity = np.cumprod(growth, axis=1)
+    peaks = np.maximum(np.maximum.accumulate(equity, axis=1), 1.0)
+    max_drawdown = np.max(1.0 - equity / peaks, axis=1)
+    ruined = np.any(equity <= ruin_level, axis=1)
+    return equity[:, -1], max_drawdown, ruined
+
+
+def _chunk_size(n_trades, hold_bars):
+    """Число путей в одной пачке, чтобы уложиться в MAX_CHUNK_CELLS"""
+    return max(1, MAX_CHUNK_CELLS // max(1, n_trades * hold_bars))
+
+
+def run_monte_carlo(history, policies, n_paths=20000, n_trades=200, seed=None,
+                    hold_bars=MAX_HOLD_BARS, ruin_level=RUIN_LEVEL, r_multiples=None):
+    """
+    Монте-Карло по вариантам политики
+
+    Args:
+        history: результат prepare_history (не нужен при r_multiples)
+        policies: словарь {название: политика}
+        n_paths: число симулируемых кривых капитала
+        n_trades: число сделок в каждой кривой
+        r_multiples: фактические результаты сделок в R; если заданы, кривые
+            строятся бутстрэпом этих результатов, а из политики берется только risk_percent
+
+    Returns:
+        Словарь {название: отчёт} с риском разорения и распределением просадок
+    """
+    chunk = _chunk_size(n_trades, 1 if r_multiples is not None else hold_bars)
+    reports = {}
+
+    for name, policy in policies.items():
+        # Один и тот же seed для всех вариантов — сравнение на одинаковых путях
+        rng = np.random.default_rng(seed)
+        final_equity = np.empty(n_paths)
+        max_drawdown = np.empty(n_paths)
+        ruined = np.empty(n_paths, dtype=bool)
+        r_sum = 0.0
+
+        for begin in range(0, n_paths, chunk):
+            end = min(begin + chunk, n_paths)
+            if r_multiples is not None:
+                r_matrix = bootstrap_outcomes(r_multiples, end - begin, n_trades, rng)
+            else:
+                r_matrix = simulate_trade_outcomes(history, policy, end - begin, n_trades, rng, hold_bars)
+            final_equity[begin:end], max_drawdown[begin:end], ruined[begin:end] = equity_statistics(
+                r_matrix, policy['risk_percent'], ruin_level
+            )
+            r_sum += r_matrix.sum()
+
+        reports[name] = summarize(final_equity, max_drawdown, ruined, r_sum / (n_paths * n_trades))
+        logging.info(f"Монте-Карло [{name}]: {format_report(reports[name])}")
+
+    return reports
+
+
+def summarize(final_equity, max_drawdown, ruined, mean_r):
+    """Сводка по распределению результатов симуляции"""
+    dd_p50, dd_p95, dd_p99 = np.percentile(max_drawdown, [50, 95, 99])
+    eq_p5, eq_p50, eq_p95 = np.percentile(final_equity, [5, 50, 95])
+    return {
+        'risk_of_ruin': float(np.mean(ruined)),
+        'mean_r': float(mean_r),
+        'drawdown_mean': float(np.mean(max_drawdown)),
+        'drawdown_p50': float(dd_p50),
+        'drawdown_p95': float(dd_p95),
+        'drawdown_p99': float(dd_p99),
+        'equity_p5': float(eq_p5),
+        'equity_p50': float(eq_p50),
+        'equity_p95': float(eq_p95),
+    }
+
+
+def format_report(report):
+    """Форматирование отчёта одной политики в строку"""
+    return (f"риск разорения {report['risk_of_ruin']:.2%}, "
+            f"средний R {report['mean_r']:+.3f}, "
+            f"просадка p50/p95/p99 {report['drawdown_p50']:.1%}/"
+            f"{report['drawdown_p95']:.1%}/{report['drawdown_p99']:.1%}, "
+            f"капитал p5/p50/p95 {report['equity_p5']:.2f}/"
+            f"{report['equity_p50']:.2f}/{report['equity_p95']:.2f}")
+
+
+def default_variants():
+    """Набор вариантов политики для сравнения с текущими настройками"""
+    return {
+        'текущая': make_policy(),
+        'без трейлинга': make_policy(use_trailing_stop=False),
+        'без частичного': make_policy(use_partial_close=False),
+        'трейлинг 2 ATR': make_policy(trailing_atr_multiplier=2.0),
+        'SL 2 ATR / TP 3 ATR': make_policy(sl_atr_multiplier=2.0, tp_atr_multiplier=3.0),
+        'риск 2%': make_policy(risk_percent=2.0),
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    if not mt5.initialize():
+        raise RuntimeError(f"Ошибка инициализации MT5: {mt5.last_error()}")
+    try:
+        data = load_history()
+    finally:
+        mt5.shutdown()
+    if data is None:
+        raise SystemExit(1)
+
+    history = prepare_history(data)
+    for name, report in run_monte_carlo(history, default_variants(), seed=42).items():
+        print(f"{name}: {format_report(report)}")
@@ -0,0 +1,200 @@
+from datetime import datetime, timedelta, timezone, time as dt_time
+from zoneinfo import ZoneInfo
+from collections import deque
+import time
+import logging
+
+# Торговые сессии по символам.
+# tz — часовой пояс сессии: имя из базы IANA (переход на летнее время учитывается
+# автоматически), "UTC" или "server" — время сервера брокера по тикам.
+# Если end <= start, сессия переходит через полночь.
+DEFAULT_SESSIONS = [
+    {'tz': 'UTC', 'days': (0, 1, 2, 3, 4), 'start': dt_time(6, 0), 'end': dt_time(22, 0)},  # 06:00–22:00 GMT, пн–пт
+]
+SESSIONS = {
+    'EURUSD': DEFAULT_SESSIONS,
+}
+
+# Праздники: (месяц, день) — каждый год, date — конкретная дата (в часовом поясе сессии)
+COMMON_HOLIDAYS = {(12, 25), (1, 1)}
+SYMBOL_HOLIDAYS = {}
+
+BAR_SECONDS = 1800          # M30
+BAR_CLOSE_DELAY = 2         # Задержка после закрытия свечи, чтобы брокер успел её сформировать
+LOOKAHEAD_DAYS = 14         # Насколько далеко искать следующее открытие сессии
+MAX_CLOCK_SKEW = 60         # Расхождение часов компьютера и сервера, о котором стоит предупредить
+SERVER_OFFSET_STEP = 1800   # Часовой пояс сервера брокера кратен 30 минутам
+DELTA_SAMPLES = 10          # Сколько последних живых тиков учитывать при оценке времени сервера
+MIN_DELTA_SAMPLES = 2       # Минимум живых тиков, чтобы начать доверять оценке
+
+# Разница "часы сервера брокера минус часы компьютера" в секундах (по живым тикам).
+# Раскладывается на часовой пояс сервера (_server_offset, кратен 30 минутам)
+# и расхождение часов (_clock_skew), которым поправляется текущее время.
+_server_delta = None
+_server_offset = 0
+_clock_skew = 0.0
+_delta_samples = deque(maxlen=DELTA_SAMPLES)
+_last_tick_msc = 0
+
+
+def current_time():
+    """Текущее время UTC (секунды) по часам сервера брокера"""
+    return time.time() + _clock_skew
+
+
+def _apply_server_delta(delta):
+    global _server_delta, _server_offset, _clock_skew
+
+    offset = round(delta / SERVER_OFFSET_STEP) * SERVER_OFFSET_STEP
+    skew = delta - offset
+    if offset != _server_offset:
+        logging.info(f"🕒 Время сервера брокера: UTC{offset / 3600:+g}")
+    if abs(skew) > MAX_CLOCK_SKEW >= abs(_clock_skew):
+        logging.warning(f"⚠️ Часы компьютера расходятся с сервером брокера на {skew:+.1f} с, "
+                        f"расписание идет по времени сервера")
+
+    _server_delta = delta
+    _server_offset = offset
+    _clock_skew = skew
+
+
+def update_server_time(symbol, tick_time_msc, host_now=None):
+    """
+    Уточнение времени сервера брокера по времени тика
+
+    MT5 отдает время тика в часах сервера. Тик считается живым, только если
+    сессия символа открыта и time_msc вырос с прошлого вызова: вне торгов
+    последний тик старый и оценка не меняется. Тик может только опаздывать,
+    поэтому разница берется как максимум по последним живым тикам.
+    """
+    global _last_tick_msc
+
+    host_now = time.time() if host_now is None else host_now
+    advanced = _last_tick_msc and tick_time_msc > _last_tick_msc
+    _last_tick_msc = max(_last_tick_msc, tick_time_msc)
+    if not advanced or not is_trading_time(symbol, host_now + _clock_skew):
+        return _server_offset
+
+    _delta_samples.append(tick_time_msc / 1000 - host_now)
+    if len(_delta_samples) >= MIN_DELTA_SAMPLES:
+        _apply_server_delta(max(_delta_samples))
+    return _server_offset
+
+
+def server_offset():
+    """Часовой пояс сервера брокера: смещение от UTC в секундах"""
+    return _server_offset
+
+
+def server_delta():
+    """Разница часов сервера брокера и компьютера в секундах или None"""
+    return _server_delta
+
+
+def restore_server_delta(delta):
+    """Восстановление сохраненной разницы часов до прихода живых тиков"""
+    if delta is not None:
+        _apply_server_delta(delta)
+
+
+def _zone(name):
+    if name == 'server':
+        return timezone(timedelta(seconds=_server_offset))
+    if name == 'UTC':
+        return timezone.utc
+    return ZoneInfo(name)
+
+
+def _is_holiday(symbol, day):
+    holidays = COMMON_HOLIDAYS | SYMBOL_HOLIDAYS.get(symbol, set())
+    return day in holidays or (day.month, day.day) in holidays
+
+
+def _session_windows(symbol, now):
+    """Окна сессий (начало, конец) в секундах UTC, пересекающие [now, now + LOOKAHEAD_DAYS]"""
+    windows = []
+    for session in SESSIONS.get(symbol, DEFAULT_SESSIONS):
+        tz = _zone(session['tz'])
+        today = datetime.fromtimestamp(now, tz).date()
+        for offset in range(-1, LOOKAHEAD_DAYS + 1):
+            day = today + timedelta(days=offset)
+            if day.weekday() not in session['days'] or _is_holiday(symbol, day):
+                continue
+
+            end_day = day if session['end'] > session['start'] else day + timedelta(days=1)
+            start = datetime.combine(day, session['start'], tzinfo=tz).timestamp()
+            end = datetime.combine(end_day, session['end'], tzinfo=tz).timestamp()
+            if end > now:
+                windows.append((start, end))
+
+    return sorted(windows)
+
+
+def current_session(symbol, now=None):
+    """Текущее окно сессии (начало, конец) или None вне торгового времени"""
+    now = current_time() if now is None else now
+    for start, end in _session_windows(symbol, now):
+        if start <= now < end:
+            return start, end
+    return None
+
+
+def is_trading_time(symbol, now=None):
+    """Проверка торгового времени символа с учетом выходных и праздников"""
+    return current_session(symbol, now) is not None
+
+
+def next_session_open(symbol, now=None):
+    """Время ближайшего открытия сессии (секунды UTC) или None"""
+    now = current_time() if now is None else now
+    starts = [start for start, _ in _session_windows(symbol, now) if start > now]
+    return min(starts) if starts else None
+
+
+def next_bar_close(now=None, bar_seconds=BAR_SECONDS):
+    """Время закрытия текущей свечи по часам сервера брокера (секунды UTC)"""
+    now = current_time() if now is None else now
+    server_now = now + _server_offset
+    return (server_now // bar_seconds + 1) * bar_seconds - _server_offset
+
+
+def next_wakeup(symbol, next_ping, position_check=None, now=None):
+    """
+    Ближайшее событие, до которого боту нечего делать
+
+    В сессии: закрытие свечи, конец сессии, пинг и (при открытой позиции)
+    контроль позиции через position_check секунд. Вне сессии: открытие
+    сессии или пинг.
+
+    Returns:
+        (время пробуждения в секундах UTC, причина)
+    """
+    now = current_time() if now is None else now
+    candidates = [(next_ping, "пинг")]
+
+    session = current_session(symbol, now)
+    if session is not None:
+        candidates.append((next_bar_close(now) + BAR_CLOSE_DELAY, "закрытие свечи"))
+        candidates.append((session[1], "закрытие сессии"))
+        if position_check is not None:
+            candidates.append((now + position_check, "контроль позиции"))
+    else:
+        session_open = next_session_open(symbol, now)
+        if session_open is not None:
+            candidates.append((session_open, "открытие сессии"))
+
+    return min(candidates)
+
+
+def sleep_until(wake_at):
+    """Сон до заданного момента (время сервера) одним вызовом, без опроса"""
+    while True:
+        remaining = wake_at - current_time()
+        if remaining <= 0:
+            return
+        time.sleep(remaining)
+
+
+def format_time(timestamp):
+    """Форматирование времени UTC для логов"""
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
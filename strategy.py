@@ -12,6 +12,7 @@ MIN_ATR = 0.0008  # Минимальная волатильность для т
 # Кэш для свечей (чтобы не запрашивать каждый раз)
 _last_candles_time = 0
 _cached_candles = None
+_cached_indicators = None
 CACHE_DURATION = 1800  # 30 минут
 
 
@@ -21,9 +22,9 @@ def get_market_data():
     
     current_time = mt5.symbol_info_tick(SYMBOL).time
     
-    # Используем кэш если данные свежие
-    if (_cached_candles is not None and 
-        current_time - _last_candles_time < CACHE_DURATION):
+    # Используем кэш, пока не закрылась текущая свеча (время тика — время сервера)
+    if (_cached_candles is not None and
+        current_time // CACHE_DURATION == _last_candles_time // CACHE_DURATION):
         return _cached_candles
     
     # Получаем новые данные
@@ -44,60 +45,153 @@ def get_market_data():
     return _cached_candles
 
 
+def get_cache_state():
+    """Состояние кэша свечей для сохранения между перезапусками"""
+    if _cached_candles is None:
+        return None
+    return {'time': _last_candles_time, 'candles': _cached_candles}
+
+
+def restore_cache_state(state):
+    """Восстановление кэша свечей; устаревший кэш обновится при первом запросе"""
+    global _last_candles_time, _cached_candles
+
+    if not state:
+        return
+    _last_candles_time = state['time']
+    _cached_candles = state['candles']
+
+
+def _calc_ema10(data):
+    return {'ema10': talib.EMA(data['close'], timeperiod=10)}
+
+
+def _calc_ema21(data):
+    return {'ema21': talib.EMA(data['close'], timeperiod=21)}
+
+
+def _calc_sma50(data):
+    return {'sma50': talib.SMA(data['close'], timeperiod=50)}
+
+
+def _calc_macd(data):
+    macd, macdsignal, macdhist = talib.MACD(
+        data['close'], fastperiod=12, slowperiod=26, signalperiod=9
+    )
+    return {'macd': macd, 'macd_signal': macdsignal, 'macd_hist': macdhist}
+
+
+def _calc_rsi(data):
+    return {'rsi': talib.RSI(data['close'], timeperiod=14)}
+
+
+def _calc_rsi_fast(data):
+    return {'rsi_fast': talib.RSI(data['close'], timeperiod=7)}
+
+
+def _calc_stoch(data):
+    slowk, slowd = talib.STOCH(
+        data['high'], data['low'], data['close'],
+        fastk_period=14, slowk_period=3, slowk_matype=0,
+        slowd_period=3, slowd_matype=0
+    )
+    return {'stoch_k': slowk, 'stoch_d': slowd}
+
+
+def _calc_atr(data):
+    return {'atr': talib.ATR(data['high'], data['low'], data['close'], timeperiod=14)}
+
+
+def _calc_bbands(data):
+    bb_upper, bb_middle, bb_lower = talib.BBANDS(
+        data['close'], timeperiod=20, nbdevup=2, nbdevdn=2, matype=0
+    )
+    return {'bb_upper': bb_upper, 'bb_middle': bb_middle, 'bb_lower': bb_lower}
+
+
+def _calc_williams_r(data):
+    return {'williams_r': talib.WILLR(data['high'], data['low'], data['close'], timeperiod=14)}
+
+
+# Источник каждого индикатора: функция считает всю группу связанных серий сразу
+INDICATOR_SOURCES = {
+    'ema10': _calc_ema10,
+    'ema21': _calc_ema21,
+    'sma50': _calc_sma50,
+    'macd': _calc_macd,
+    'macd_signal': _calc_macd,
+    'macd_hist': _calc_macd,
+    'rsi': _calc_rsi,
+    'rsi_fast': _calc_rsi_fast,
+    'stoch_k': _calc_stoch,
+    'stoch_d': _calc_stoch,
+    'atr': _calc_atr,
+    'bb_upper': _calc_bbands,
+    'bb_middle': _calc_bbands,
+    'bb_lower': _calc_bbands,
+    'williams_r': _calc_williams_r,
+}
+
+# Индикаторы по этапам принятия решения (в порядке проверки в get_signal)
+VOLATILITY_INDICATORS = ['atr']
+TREND_INDICATORS = ['ema10', 'ema21', 'macd_hist']
+MOMENTUM_INDICATORS = ['rsi', 'stoch_k', 'stoch_d']
+
+
+class LazyIndicators:
+    """
+    Ленивый набор индикаторов: серия считается при первом обращении
+
+    Поддерживает доступ как к словарю (indicators['atr']), поэтому
+    функции проверки сигналов работают с ним без изменений.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self._values = {}
+
+    def __getitem__(self, name):
+        if name not in self._values:
+            self._values.update(INDICATOR_SOURCES[name](self.data))
+        return self._values[name]
+
+    def __contains__(self, name):
+        return name in INDICATOR_SOURCES
+
+    def computed(self):
+        """Список уже рассчитанных индикаторов"""
+        return list(self._values)
+
+
+def get_indicators(data):
+    """Ленивые индикаторы для данных, переиспользуемые пока свечи в кэше"""
+    global _cached_indicators
+
+    if _cached_indicators is None or _cached_indicators.data is not data:
+        _cached_indicators = LazyIndicators(data)
+    return _cached_indicators
+
+
 def calculate_indicators(data):
-    """Расчет технических индикаторов"""
+    """Расчет всех технических индикаторов"""
     try:
-        indicators = {}
-        
-        # Скользящие средние
-        indicators['ema10'] = talib.EMA(data['close'], timeperiod=10)
-        indicators['ema21'] = talib.EMA(data['close'], timeperiod=21)
-        indicators['sma50'] = talib.SMA(data['close'], timeperiod=50)
-        
-        # MACD
-        macd, macdsignal, macdhist = talib.MACD(
-            data['close'], fastperiod=12, slowperiod=26, signalperiod=9
-        )
-        indicators['macd'] = macd
-        indicators['macd_signal'] = macdsignal
-        indicators['macd_hist'] = macdhist
-        
-        # RSI
-        indicators['rsi'] = talib.RSI(data['close'], timeperiod=14)
-        indicators['rsi_fast'] = talib.RSI(data['close'], timeperiod=7)
-        
-        # Stochastic
-        slowk, slowd = talib.STOCH(
-            data['high'], data['low'], data['close'],
-            fastk_period=14, slowk_period=3, slowk_matype=0,
-            slowd_period=3, slowd_matype=0
-        )
-        indicators['stoch_k'] = slowk
-        indicators['stoch_d'] = slowd
-        
-        # ATR для волатильности
-        indicators['atr'] = talib.ATR(data['high'], data['low'], data['close'], timeperiod=14)
-        
-        # Bollinger Bands
-        bb_upper, bb_middle, bb_lower = talib.BBANDS(
-            data['close'], timeperiod=20, nbdevup=2, nbdevdn=2, matype=0
-        )
-        indicators['bb_upper'] = bb_upper
-        indicators['bb_middle'] = bb_middle
-        indicators['bb_lower'] = bb_lower
-        
-        # Williams %R
-        indicators['williams_r'] = talib.WILLR(
-            data['high'], data['low'], data['close'], timeperiod=14
-        )
-        
-        return indicators
-        
+        indicators = LazyIndicators(data)
+        return {name: indicators[name] for name in INDICATOR_SOURCES}
+
     except Exception as e:
         logging.error(f"Ошибка расчета индикаторов: {e}")
         return None
 
 
+def has_invalid_values(indicators, names):
+    """Проверка валидности последних значений индикаторов"""
+    for indicator in names:
+        if np.isnan(indicators[indicator][-1]):
+            logging.warning(f"Недопустимое значение индикатора: {indicator}")
+            return True
+    return False
+
+
 def check_trend_alignment(indicators):
     """Проверка согласованности трендовых индикаторов"""
     bullish_signals = 0
@@ -186,45 +280,44 @@ def get_signal():
     
     Логика стратегии:
     1. Получаем рыночные данные
-    2. Рассчитываем технические индикаторы
+    2. Применяем фильтр волатильности (нужен только ATR)
     3. Проверяем согласованность трендовых сигналов
     4. Проверяем импульсные осцилляторы
-    5. Применяем фильтр волатильности
-    6. Принимаем решение на основе весов сигналов
+    5. Принимаем решение на основе весов сигналов
+
+    Индикаторы считаются лениво, по мере надобности на каждом этапе,
+    поэтому отклонение по волатильности стоит одного расчета ATR.
     """
     try:
         # Получение данных
         market_data = get_market_data()
         if market_data is None:
             return None
-        
+
         # Проверка достаточности данных
         if len(market_data['close']) < 100:
             logging.warning("Недостаточно исторических данных")
             return None
-        
-        # Расчет индикаторов
-        indicators = calculate_indicators(market_data)
-        if indicators is None:
-            return None
-        
-        # Проверка валидности индикаторов
-        required_indicators = ['ema10', 'ema21', 'macd_hist', 'rsi', 'stoch_k', 'stoch_d', 'atr']
-        for indicator in required_indicators:
-            if np.isnan(indicators[indicator][-1]):
-                logging.warning(f"Недопустимое значение индикатора: {indicator}")
-                return None
-        
+
+        indicators = get_indicators(market_data)
+
         # Фильтр волатильности
+        if has_invalid_values(indicators, VOLATILITY_INDICATORS):
+            return None
         volatility_ok, vol_msg = check_volatility_filter(indicators)
         if not volatility_ok:
             logging.info(f"Сигнал отклонен: {vol_msg}")
+            logging.debug(f"Рассчитаны индикаторы: {', '.join(indicators.computed())}")
             return None
-        
+
         # Анализ трендовых сигналов
+        if has_invalid_values(indicators, TREND_INDICATORS):
+            return None
         trend_bullish, trend_bearish = check_trend_alignment(indicators)
-        
+
         # Анализ импульсных сигналов
+        if has_invalid_values(indicators, MOMENTUM_INDICATORS):
+            return None
         momentum_bullish, momentum_bearish = check_momentum_oscillators(indicators)
         
         # Подсчет общих сигналов
@@ -265,10 +358,8 @@ def get_signal_strength():
     if market_data is None:
         return None
     
-    indicators = calculate_indicators(market_data)
-    if indicators is None:
-        return None
-    
+    indicators = get_indicators(market_data)
+
     trend_bullish, trend_bearish = check_trend_alignment(indicators)
     momentum_bullish, momentum_bearish = check_momentum_oscillators(indicators)
     